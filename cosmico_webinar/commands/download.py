@@ -12,14 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import logging
+import os
 import pathlib
-from queue import Queue
-from threading import Event, Thread
+import signal
+import socket
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from threading import Event, Lock, get_ident, local
 from typing import TypedDict
 
 import click
 import requests
+from requests.adapters import HTTPAdapter
 from rich.console import Group
 from rich.live import Live
 from rich.panel import Panel
@@ -43,14 +49,20 @@ from ..streamyard import StreamYard
 
 logger = logging.getLogger(__name__)
 
+# slugify does full Unicode normalization on every call; memoize it so
+# repeated titles only pay for it once
+slugify = functools.lru_cache(maxsize=None)(slugify)
+
 
 def crop_string(s: str, N: int, ellipsis="…", end=False):
+    budget = N - len(ellipsis)
+
     # Check if the string needs to be cropped
-    if len(s) > N - len(ellipsis):
+    if len(s) > budget:
         if end:
-            return s[(-(N - len(ellipsis))) :] + ellipsis
+            return s[-budget:] + ellipsis
         else:
-            return ellipsis + s[(-(N - len(ellipsis))) :]
+            return ellipsis + s[-budget:]
     else:
         return s
 
@@ -58,115 +70,207 @@ def crop_string(s: str, N: int, ellipsis="…", end=False):
 VideoEntry = TypedDict("VideoEntry", {"title": str, "url": str, "poster": str})
 
 
-_sentinel = object()
+DEFAULT_CHUNK_SIZE = 1 << 20  # 1 MiB reads keep the Python-level loop off the hot path
+
+FETCH_WORKERS = 5  # Keep the discovery concurrency low to avoid 429s
+
+# Progress.update takes a lock and schedules a render on every call, so
+# batch downloaded bytes and flush at most every 4 MiB or 100 ms
+PROGRESS_FLUSH_BYTES = 4 << 20
+PROGRESS_FLUSH_SECONDS = 0.1
+
+# Sync dirty pages to disk every so often so slow disks don't stall on a
+# huge writeback burst when the file is closed
+FDATASYNC_BYTES = 128 << 20
+
+DOWNLOAD_HEADERS = {
+    "User-Agent": os.environ.get(
+        "COSMICO_UA",
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+    ),
+}
+
 _stop_event = Event()
 
 
-class DownloaderWorker(Thread):
+class Downloader:
     def __init__(
         self,
-        queue: Queue[VideoEntry],
         output: pathlib.Path,
         progress: Progress,
-        overall_progress: tuple[Progress, TaskID],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
     ):
-        super().__init__()
-        self.queue = queue
         self.output = output
+        self.chunk_size = chunk_size
         self.progress = progress
-        self.overall_progress = overall_progress[0]
-        self.overall_task = overall_progress[1]
 
-        self.is_running = True
+        # One session per pool thread, so each thread keeps reusing its
+        # connection and the TCP+TLS handshake is only paid once per thread
+        self._thread_state = local()
+
+        # In-flight responses by thread id, closed by the SIGINT handler to
+        # abort the transfers
+        self._inflight: dict[int, requests.Response] = {}
+        self._inflight_lock = Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._thread_state, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._thread_state.session = session
+        return session
+
+    def abort(self):
+        with self._inflight_lock:
+            responses = list(self._inflight.values())
+
+        for response in responses:
+            # Closing the response here would block behind the reader's lock
+            # while a worker sits in a stalled read. Shutting the socket down
+            # makes the blocked read fail immediately instead, and the worker
+            # unwinds and closes its own response
+            try:
+                response.raw._fp.fp.raw._sock.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                try:
+                    response.close()
+                except Exception:
+                    pass
 
     def download_file(self, url: str, filename: str, local_file: pathlib.Path):
         # Create task
-        self.task_id = self.progress.add_task(
+        task_id = self.progress.add_task(
             "",
             start=False,
             filename=filename,
         )
 
+        try:
+            self._download_file(task_id, url, local_file)
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(get_ident(), None)
+
+            self.progress.remove_task(task_id)
+
+    def _download_file(self, task_id: TaskID, url: str, local_file: pathlib.Path):
+        headers = DOWNLOAD_HEADERS
+
+        # Resume a partial file from where the last run stopped
+        local_size = local_file.stat().st_size if local_file.exists() else 0
+        if local_size:
+            headers = {**DOWNLOAD_HEADERS, "Range": f"bytes={local_size}-"}
+
         # Download the file
-        with requests.get(
+        with self.session.get(
             url,
-            headers={
-                "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",  # noqa: E501
-            },
+            headers=headers,
             stream=True,
         ) as r:
-            remote_file_size = int(r.headers.get("Content-Length", 0))
+            with self._inflight_lock:
+                self._inflight[get_ident()] = r
+
+            # Range not satisfiable: the local file already covers the full
+            # length - unless it is larger than the remote (corrupt file or a
+            # replaced VOD), in which case start over from scratch
+            if r.status_code == 416:
+                remote_length = r.headers.get("Content-Range", "").rpartition("/")[2]
+                if remote_length.isdigit() and local_size != int(remote_length):
+                    local_file.unlink()
+                    self._download_file(task_id, url, local_file)
+                    return
 
-            # Check if the file already exists and has the same size
-            if local_file.exists() and local_file.stat().st_size == remote_file_size:
                 self.progress.console.print(f"File {local_file} already downloaded.")
                 return
 
-            # Update task total
-            self.progress.update(self.task_id, total=remote_file_size)
-
             r.raise_for_status()
-            with open(local_file, "wb") as f:
-                self.progress.start_task(self.task_id)
-                for chunk in r.iter_content(chunk_size=8192):
-                    if _stop_event.is_set():  # Exit early if stop event is set
-                        return
 
-                    self.progress.update(self.task_id, advance=len(chunk))
-                    f.write(chunk)
+            remote_file_size = int(r.headers.get("Content-Length", 0))
 
-    def run(self):
-        while self.is_running:
-            self.task_id = None
+            if r.status_code == 206:
+                # Partial content: append the remaining bytes
+                mode = "ab"
+                total = local_size + remote_file_size
+            else:
+                # Server ignored the Range header (or there was no partial
+                # file): check for a complete file, otherwise start over
+                if local_size and local_size == remote_file_size:
+                    self.progress.console.print(f"File {local_file} already downloaded.")
+                    return
 
-            if _stop_event.is_set():
-                self.is_running = False
-                return
+                mode = "wb"
+                local_size = 0
+                total = remote_file_size
 
-            try:
-                # Get entry from the queue
-                entry = self.queue.get()
+            # Update task total
+            self.progress.update(task_id, total=total, completed=local_size)
+
+            # Unbuffered: 1 MiB chunks go straight to write(2) instead of
+            # being copied through Python's buffered writer first
+            with open(local_file, mode, buffering=0) as f:
+                # Tell the kernel this is a big sequential write that won't be
+                # re-read, so it doesn't crowd the page cache (POSIX only)
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+                self.progress.start_task(task_id)
+                buffered = 0
+                unsynced = 0
+                last_flush = time.monotonic()
+                # Read from the raw urllib3 response: iter_content() caps us at its
+                # chunk size, while large reads keep the per-iteration overhead low.
+                # Cancellation needs no per-chunk check: the SIGINT handler closes
+                # the response, which makes the read raise
+                while chunk := r.raw.read(self.chunk_size, decode_content=True):
+                    f.write(chunk)
 
-                # Check if we're done
-                if entry is _sentinel:
-                    self.is_running = False
-                    return
+                    buffered += len(chunk)
+                    now = time.monotonic()
+                    if buffered >= PROGRESS_FLUSH_BYTES or now - last_flush > PROGRESS_FLUSH_SECONDS:
+                        self.progress.update(task_id, advance=buffered)
+                        unsynced += buffered
+                        buffered = 0
+                        last_flush = now
 
-                output_filename = slugify(entry["title"])
-                output_video = self.output / f"{output_filename}.mp4"
-                # output_poster = self.output / f"{output_filename}.jpg"
+                        if unsynced >= FDATASYNC_BYTES and hasattr(os, "fdatasync"):
+                            os.fdatasync(f.fileno())
+                            unsynced = 0
 
-                vod_url = entry["url"]
-                # poster_url = entry["poster"]
+                if buffered:
+                    self.progress.update(task_id, advance=buffered)
 
-                # Download the video
-                self.download_file(vod_url, crop_string(str(output_video), 20), output_video)
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
 
-                # Download the poster
-                # self.download_file(poster_url, output_filename, output_poster)
+    def download(self, entry: VideoEntry):
+        # Don't start new downloads once a stop is in progress
+        if _stop_event.is_set():
+            return
 
-            except Exception as e:
-                self.progress.console.print(f"Error: {e}")
-                self.is_running = False
-            finally:
-                # Stop the download progress task
-                if hasattr(self, "task_id") and self.task_id is not None:
-                    self.progress.remove_task(self.task_id)
+        output_filename = slugify(entry["title"])
+        output_video = self.output / f"{output_filename}.mp4"
+        # output_poster = self.output / f"{output_filename}.jpg"
+
+        vod_url = entry["url"]
+        # poster_url = entry["poster"]
 
-                # Update overall progress
-                if self.is_running:
-                    self.overall_progress.update(
-                        self.overall_task,
-                        advance=1,
-                    )
+        # Download the video
+        self.download_file(vod_url, crop_string(str(output_video), 20), output_video)
 
-                # Indicate task completion
-                self.queue.task_done()
+        # Download the poster
+        # self.download_file(poster_url, output_filename, output_poster)
 
 
 @click.command(name="download", help="Download all webinars from EventBrite")
 @click.option("--output", help="Output directory")
 @click.option("--threads", default=2, help="Number of download threads to use")
+@click.option(
+    "--chunk-size", default=DEFAULT_CHUNK_SIZE, type=click.IntRange(min=1), help="Download read size in bytes"
+)
 @click.option("--pagesize", default=20, help="Number of events to fetch per page")
 @click.option("--email", required=True, help="Email to use for registration")
 @click.option("--first-name", required=True, help="First name to use for registration")
@@ -176,6 +280,7 @@ def cli(
     ctx: click.Context,
     output: str,
     threads: int,
+    chunk_size: int,
     pagesize: int,
     email: str,
     first_name: str,
@@ -241,22 +346,24 @@ def cli(
             description=f"{steps[current_step]} ({current_step+1}/{len(steps)})",
         )
         task_id = generic_progress.add_task(steps[current_step], total=len(events))
-        events = eventbrite.get_all_events(ORG_ID, pagesize)
 
-        # TODO: multithreading to speed up the process
+        def fetch_webinar_urls(event: dict) -> list[str]:
+            event_data = eventbrite.get_structured_content(event["id"])
+            return [x["data"]["webinar_url"]["url"] for x in event_data["modules"] if x["type"] == "webinar"]
+
         urls = []
-        for event in events:
-            try:
-                event_data = eventbrite.get_structured_content(event["id"])
-                for x in event_data["modules"]:
-                    if x["type"] == "webinar":
-                        urls.append(x["data"]["webinar_url"]["url"])
-            except requests.exceptions.HTTPError as e:
-                overall_progress.console.print(f"Error while fetching event {event['id']}: {e}")
-            except KeyError:
-                overall_progress.console.print(f"Error while fetching event {event['id']}: No webinar URL")
-
-            generic_progress.update(task_id, advance=1)
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            futures = {executor.submit(fetch_webinar_urls, event): event for event in events}
+            for future in as_completed(futures):
+                event = futures[future]
+                try:
+                    urls.extend(future.result())
+                except requests.exceptions.HTTPError as e:
+                    overall_progress.console.print(f"Error while fetching event {event['id']}: {e}")
+                except KeyError:
+                    overall_progress.console.print(f"Error while fetching event {event['id']}: No webinar URL")
+                finally:
+                    generic_progress.update(task_id, advance=1)
         generic_progress.update(
             task_id, description=f"Found {len(urls)} urls.", completed=len(events), total=len(events)
         )
@@ -276,35 +383,43 @@ def cli(
             verify=ctx.obj["verify"],
         )
 
-        vod_download_data = []
-        for url in urls:
-            try:
-                data = streamyard.get_webinar_info(url)
+        def fetch_vod_entry(url: str) -> VideoEntry:
+            data = streamyard.get_webinar_info(url)
 
-                # Registration needed
-                if data["isRegistrationEnabled"] is True:
-                    streamyard.register_webinar(url, data, email, first_name, last_name)
+            # Registration needed
+            if data["isRegistrationEnabled"] is True:
+                registration = streamyard.register_webinar(url, data, email, first_name, last_name)
 
-                    # Refresh data
+                # The registration response usually carries the unlocked webinar
+                # data already; only refresh when it doesn't
+                if "vodUrl" in registration:
+                    data = {**data, **registration}
+                else:
                     data = streamyard.get_webinar_info(url)
 
-                if "vodUrl" not in data:
-                    raise Exception("VOD not found")
-
-                if data["isVodMediaDeleted"] is True:
-                    raise Exception("VOD media has been deleted")
-
-                vod_download_data.append(
-                    {
-                        "title": data["title"],
-                        "url": data["vodUrl"],
-                        "poster": data["vodPosterUrl"],
-                    }
-                )
-            except Exception as e:
-                overall_progress.console.print(f"Error: {e} for {url}")
-            finally:
-                generic_progress.update(task_id, advance=1)
+            if "vodUrl" not in data:
+                raise Exception("VOD not found")
+
+            if data["isVodMediaDeleted"] is True:
+                raise Exception("VOD media has been deleted")
+
+            return {
+                "title": data["title"],
+                "url": data["vodUrl"],
+                "poster": data["vodPosterUrl"],
+            }
+
+        vod_download_data = []
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            futures = {executor.submit(fetch_vod_entry, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    vod_download_data.append(future.result())
+                except Exception as e:
+                    overall_progress.console.print(f"Error: {e} for {url}")
+                finally:
+                    generic_progress.update(task_id, advance=1)
         generic_progress.update(
             task_id, description=f"Found {len(vod_download_data)} VODs.", completed=len(events), total=len(events)
         )
@@ -323,41 +438,37 @@ def cli(
         output_dir = pathlib.Path.cwd() / "output"
         output_dir.mkdir(exist_ok=True, parents=True)
 
-        # Prepare queue
-        queue = Queue()
-        for file in vod_download_data:
-            queue.put(file)
+        downloader = Downloader(output_dir, download_progress, chunk_size)
 
-        workers: list[Thread] = []
-        for _ in range(threads):
-            # Add a sentinel to the queue to indicate the end of the queue
-            queue.put(_sentinel)
+        with ThreadPoolExecutor(max_workers=min(threads, len(vod_download_data)) or 1) as executor:
+            futures = [executor.submit(downloader.download, entry) for entry in vod_download_data]
 
-            worker = DownloaderWorker(
-                queue,
-                output_dir,
-                download_progress,
-                (generic_progress, task_id),
-            )
-            worker.start()
-            workers.append(worker)
+            # Stop on SIGINT: cancel what hasn't started and abort the
+            # in-flight transfers by closing the responses being read
+            def handle_sigint(signum, frame):
+                overall_progress.console.print("Keyboard Interrupt received! Stopping workers...")
+                _stop_event.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                downloader.abort()
 
-        # TODO: won't work if uncommented
-        # Wait for all files to download
-        # queue.join()
+            previous_handler = signal.signal(signal.SIGINT, handle_sigint)
 
-        # Wait for all workers to finish
-        try:
-            for worker in workers:
-                worker.join()
-        except KeyboardInterrupt:
-            print("Keyboard Interrupt received! Stopping workers...")
-            _stop_event.set()
-
-            # TODO: not sure if this is necessary
-            # Wait for remaining workers to finish
-            for worker in workers:
-                worker.join()
+            try:
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except CancelledError:
+                        pass
+                    except Exception as e:
+                        # A stop closes the in-flight response, so the
+                        # resulting read error is expected and not worth
+                        # reporting
+                        if not _stop_event.is_set():
+                            overall_progress.console.print(f"Error: {e}")
+                    else:
+                        generic_progress.update(task_id, advance=1)
+            finally:
+                signal.signal(signal.SIGINT, previous_handler)
 
         generic_progress.stop_task(task_id)
         current_step += 1
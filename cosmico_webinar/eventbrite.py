@@ -12,12 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 from . import __version__
 
+# orjson decodes the API payloads a few times faster than stdlib json
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+PAGE_WORKERS = 8  # Pages fetched speculatively per pagination batch
+
 
 class EventBrite:
     def __init__(self, proxies: dict[str, str] = {}, verify: bool = True):
@@ -30,6 +41,22 @@ class EventBrite:
         self.session.proxies = proxies
         self.session.verify = verify
 
+        # The default adapter caps the pool at 10 connections, which the
+        # threaded pagination and discovery outgrow; retry transient errors
+        # and 429s with a backoff instead of failing the whole event.
+        # raise_on_status=False hands exhausted retries back as the final
+        # response, so callers keep getting HTTPError from raise_for_status()
+        # instead of RetryError
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
         if not verify:
             __import__("urllib3").disable_warnings()
 
@@ -49,7 +76,7 @@ class EventBrite:
             },
         )
         r.raise_for_status()
-        data = r.json()
+        data = json_loads(r.content)
         return (data["data"]["events"], data["data"]["has_next_page"])
 
     def get_structured_content(self, event_id: int) -> dict:
@@ -60,18 +87,26 @@ class EventBrite:
             },
         )
         r.raise_for_status()
-        return r.json()
+        return json_loads(r.content)
 
     def get_events(self, org_id: str, type: Literal["past", "future"], pagesize: int = 5):
         events = []
 
-        # Get all events
+        # The API only tells us whether another page exists, so fetch pages
+        # speculatively in batches and stop at the first one without a next page
         page = 1
         has_next_page = True
-        while has_next_page:
-            data, has_next_page = self.get_showmore(org_id, page, pagesize, type)
-            events.extend(data)
-            page += 1
+        with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as executor:
+            while has_next_page:
+                batch = executor.map(
+                    lambda p: self.get_showmore(org_id, p, pagesize, type),
+                    range(page, page + PAGE_WORKERS),
+                )
+                for data, has_next_page in batch:
+                    events.extend(data)
+                    if not has_next_page:
+                        break
+                page += PAGE_WORKERS
 
         return events
 
@@ -82,7 +117,8 @@ class EventBrite:
         return self.get_events(org_id, "future", pagesize)
 
     def get_all_events(self, org_id: str, pagesize: int = 12) -> list[dict]:
-        events = []
-        events.extend(self.get_future_events(org_id, pagesize))
-        events.extend(self.get_past_events(org_id, pagesize))
-        return events
+        # Future and past listings are independent, so fetch them concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future = executor.submit(self.get_future_events, org_id, pagesize)
+            past = executor.submit(self.get_past_events, org_id, pagesize)
+            return future.result() + past.result()
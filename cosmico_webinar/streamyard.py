@@ -12,12 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+# orjson decodes the API payloads a few times faster than stdlib json
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
 
 
 class StreamYard:
     def __init__(self, proxies: dict[str, str] = {}, verify: bool = True):
         self.session = requests.Session()
+        self._bootstrap_lock = threading.Lock()
         self.session.headers.update(
             {
                 "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",  # noqa: E501
@@ -27,23 +38,49 @@ class StreamYard:
         self.session.proxies = proxies
         self.session.verify = verify
 
+        # Match the pool to the threaded webinar lookups and retry transient
+        # errors and 429s with a backoff; raise_on_status=False keeps
+        # exhausted retries surfacing as HTTPError from raise_for_status()
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
         if not verify:
             __import__("urllib3").disable_warnings()
 
+    @staticmethod
+    def _webinar_id(url: str) -> str:
+        return url.rsplit("/", 1)[-1]
+
+    def _bootstrap(self, url: str):
+        # Fetch the watch page once to obtain the jwtOnAir cookie; the lock
+        # keeps concurrent callers from each paying the page fetch
+        with self._bootstrap_lock:
+            if "jwtOnAir" in self.session.cookies:
+                return
+
+            r = self.session.get(url)
+            r.raise_for_status()
+
     def get_webinar_info(self, url: str) -> dict:
-        webinar_id = url.split("/")[-1]
+        webinar_id = self._webinar_id(url)
 
         # Update token
         if "jwtOnAir" not in self.session.cookies:
-            r = self.session.get(url)
-            r.raise_for_status()
+            self._bootstrap(url)
 
         r = self.session.get(f"https://oa-api.streamyard.com/api/public/webinars/{webinar_id}")
         r.raise_for_status()
-        return r.json()
+        return json_loads(r.content)
 
     def register_webinar(self, url: str, webinar_data: dict, email: str, first_name: str, last_name: str):
-        webinar_id = url.split("/")[-1]
+        webinar_id = self._webinar_id(url)
 
         fields_id = webinar_data["registrationFieldDefinitions"][0]["id"]
         fields_data = webinar_data["registrationFieldDefinitions"][0]["fields"]["data"]
@@ -73,4 +110,4 @@ class StreamYard:
         }
         r = self.session.post(registration_url, json=registration_data, headers={"X-Csrf-Protection": "true"})
         r.raise_for_status()
-        return r.json()
+        return json_loads(r.content)